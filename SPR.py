@@ -8,9 +8,9 @@ Implement the Symbolic Pattern Recognition (SPR) methods as published by:
     Fibrillation via Symbolic Pattern Recognition. Journal of Medical Statistics 
     and Informatics 4 (8), 1–9.
 
-Several optimizations have been used, including efficient hash-based substring
-search and several recurrence relations between sequentially-sized lists of 
-ngrams and pattern transition matrices.
+Several optimizations have been used, including counting all the patterns of a
+given length in a single pass over the sequence and several recurrence relations
+between sequentially-sized lists of ngrams and pattern transition matrices.
 
 
 Copyright (C) 2017 J. Andrew Howe
@@ -32,10 +32,30 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # FURTHER CHANCES FOR OPTIMIZATION?  more numpy?
 
 import numpy as np
-from HashSubstringSearch import *
+import dataclasses
 from supportfuncs import *
+from jitfuncs import *
 import math
 
+@dataclasses.dataclass
+class PTPData:
+  """
+  A PTP matrix, stored as contiguous arrays rather than a nested list.  Only the
+  frequencies are stored; the relative frequencies are computed when needed.
+  ---
+  Attributes Are:
+  counts: (n_s,N) int32 array of following frequencies for each of N ngrams
+  totals: (N,) int32 array of total frequencies for each ngram
+  probs: (n_s,N) float32 array of relative frequencies, computed from the others
+  """
+  counts: np.ndarray
+  totals: np.ndarray
+  
+  @property
+  def probs(self):
+    return np.divide(self.counts,self.totals,out=np.zeros(self.counts.shape,dtype=np.float32),\
+      where=(self.totals != 0))
+
 class SPRanal:
   """
   Container of all the important SPR-related attributes and methods.
@@ -47,12 +67,9 @@ class SPRanal:
   n: integer length of the sequence
   maxn_p: integer maximum size n_p of PTP matrices to generate
   t_np: float minimum sparsity index allowed to keep a PTP matrix
-  hashP: a dict holding the hashing parameters x & p:
-    p: prime integer sufficiently large to minimize the probability of collisions
-    x: random integer in the inclusive range [0,p-1] for the polynomial
+  hashP: a dict holding the former hashing parameters x & p; no longer used
   n_p: integer length of the longest subsequence used in this SPR analysis
-  PTPs: list of n_p "useful" PTP matrices
-  ngrams: list of n_p lists of ngrams
+  PTPs: list of n_p "useful" PTP matrices, each a PTPData
   sparsity: nested list holding the sparsity table; sublists hold Observed counts, 
     Possible counts, and SI ratios by n_p, up to n_p
   ---
@@ -61,6 +78,7 @@ class SPRanal:
   BuildPTPs: build optimal set of PTP matrices (Section 3.1)
   Distance: compute the distance between PTP matrices (Section 3.4)
   MakenGrams: generate ngrams
+  NgramStr: generate the ngram for a row of a PTP matrix
   Predict: predict the next symbol from a sequence (Section 3.2)
   PrintPTP: print a specified PTP matrix
   PrintiPTP: print a PTP matrix generated by BuildPTPs
@@ -70,8 +88,25 @@ class SPRanal:
   def __init__(self,alpha,sequence):
     self.alpha = alpha
     self.n_s = len(alpha)
+    # symbols are coded as int16, with -1 for those not in the alphabet
+    if (self.n_s > np.iinfo(np.int16).max):
+      raise ValueError('alphabet can have at most %d symbols'%np.iinfo(np.int16).max)
+    self.alphaInd = {a:i for i,a in enumerate(alpha)}
     self.sequence = sequence
     self.n = len(sequence)
+    # if all symbols fit in a byte, keep the sequence as bytes too, and a lookup
+    # table from byte => alphabet index (-1 for symbols not in the alphabet)
+    try:
+      alphaBytes = np.frombuffer(''.join(alpha).encode('latin-1'),dtype=np.uint8)
+      if (alphaBytes.size != self.n_s):
+        raise ValueError('symbols must be single characters to use bytes')
+      self.byteCodes = np.full(256,-1,dtype=np.int16)
+      self.byteCodes[alphaBytes] = np.arange(self.n_s)
+      self.seqBytes = sequence.encode('latin-1')
+    except (UnicodeEncodeError,ValueError):
+      self.byteCodes = None; self.seqBytes = None
+    # code the sequence by alphabet index
+    self.code = self.__Code__(sequence if self.seqBytes is None else self.seqBytes)
     self.n_p = None
     self.maxn_p = None
     self.t_np = None
@@ -92,26 +127,50 @@ class SPRanal:
       return "SPR Anal Object(SetPTPParams not run)\n\talpha(%d)=%r\n\tsequence(%d)=%r"\
       %(self.n_s,self.alpha,self.n,self.sequence)
     elif self.n_p is None:
-       return "SPR Anal Object(BuildPTPs not run)\n\talpha(%d)=%r\n\tsequence(%d)=%r\n\tmax n_p=%d\n\tt_np=%0.4f\n\thash(p=%d,x=%d)"\
-      %(self.n_s,self.alpha,self.n,self.sequence,self.maxn_p,self.t_np,self.hashP['p'],self.hashP['x'])     
+       return "SPR Anal Object(BuildPTPs not run)\n\talpha(%d)=%r\n\tsequence(%d)=%r\n\tmax n_p=%d\n\tt_np=%0.4f"\
+      %(self.n_s,self.alpha,self.n,self.sequence,self.maxn_p,self.t_np)     
     else:
-      return "SPR Anal Object(n_p=%r)\n\talpha(%d)=%r\n\tsequence(%d)=%r\n\tmax n_p=%d\n\tt_np=%0.4f\n\thash(p=%d,x=%d)"\
-      %(self.n_p,self.n_s,self.alpha,self.n,self.sequence,self.maxn_p,self.t_np,self.hashP['p'],self.hashP['x'])
+      return "SPR Anal Object(n_p=%r)\n\talpha(%d)=%r\n\tsequence(%d)=%r\n\tmax n_p=%d\n\tt_np=%0.4f"\
+      %(self.n_p,self.n_s,self.alpha,self.n,self.sequence,self.maxn_p,self.t_np)
   
-  def SetPTPParams(self,maxn_p,t_np,hashP):
+  def SetPTPParams(self,maxn_p,t_np,hashP=None):
     self.maxn_p = maxn_p
     self.t_np = t_np
-    try:
-      _ = hashP['p']; _ = hashP['x']
-    except AttributeError:
-      raise AttributeError("hashP must be a dict with integer-valued keys 'p' and 'x'!")
-    self.hashP = hashP
+    # the substring search no longer hashes, but keep the parameters if passed
+    if hashP is not None:
+      self.hashP = hashP
+  
+  def __Code__(self,syms):
+    """
+    Code symbols by their index in the alphabet, -1 for symbols not in it.
+    ---
+    codes = SPRanal.__Code__(syms)
+    ---
+    syms: string of symbols, or bytes if the symbols fit in a byte
+    codes: int16 array of the symbol codes
+    """
+    
+    if isinstance(syms,bytes):
+      return self.byteCodes[np.frombuffer(syms,dtype=np.uint8)]
+    return np.fromiter((self.alphaInd.get(c,-1) for c in syms),dtype=np.int16,count=len(syms))
   
-  def __SetPTP__(self,n_p,PTPs,ngrams,sparsities):
+  def __SetPTP__(self,n_p,PTPs,sparsities):
     self.n_p = n_p
     self.PTPs = PTPs
-    self.ngrams = ngrams
     self.sparsities = sparsities
+    # flattened probabilities for Distance, keyed by alphabet size; the
+    # unpadded ones are needed for any Distance, so build them now
+    self.distVecs = dict()
+    self.__DistVec__(self.n_s)
+    # stack the rows of all PTPs, for the compiled functions
+    self.rowOffs = np.cumsum([0]+[self.n_s**(i+1) for i in range(n_p)])[:-1].astype(np.int64)
+    self.countTable = np.zeros((0,self.n_s),dtype=np.int32)
+    self.totTable = np.zeros(0,dtype=np.int32)
+    if PTPs:
+      self.countTable = np.ascontiguousarray(np.concatenate([P.counts.T for P in PTPs]))
+      self.totTable = np.concatenate([P.totals for P in PTPs])
+    # probabilities from Predict, saved by row in the stacked tables
+    self.predCache = np.full((self.totTable.size,self.n_s),np.nan)
     self.PTPset = True
 
   def PrintiPTP(self,indx,hideMiss=False):
@@ -127,70 +186,57 @@ class SPRanal:
     JAH 20170619
     """
 
-    # get the largest frequency, for formatting
-    mxFreq = max(self.PTPs[indx][self.n_s])
-    fmts = ['%%%dd'%(int(math.log10(mxFreq))+1)]*(self.n_s+1)
-    
-    # create the colunn heads and formatting strings
-    colHds = self.alpha.copy(); colHds.append('Tot')
-    if (len(self.PTPs[indx]) > self.n_s+1):
-      # relFreq was on, so add alpha again
-      colHds.extend(self.alpha)
-      # and add the formats for freqs
-      fmts.extend(['%0.4f']*self.n_s)
-      
-    data = np.array(self.PTPs[indx]).T
-    
-    # hide unobserved ngrams rows
-    if hideMiss:
-      # get the missing rows ...
-      notMiss = [i for i,t in enumerate(self.PTPs[indx][self.n_s]) if t != 0]
-      # ... and remove them
-      data = data[notMiss,:]
-      rowHds = [self.ngrams[indx][i] for i in notMiss]
-    else:
-      rowHds = self.ngrams[indx]
-  
-    return PrintTable(data,fmts,colHds,rowHds)
+    return self.PrintPTP(self.PTPs[indx],hideMiss=hideMiss,n_p=indx+1)
   
-  def PrintPTP(self,PTP,ngrams,hideMiss=False):
+  def PrintPTP(self,PTP,ngrams=None,hideMiss=False,n_p=None):
     """
     Print a nicely-formatted PTP matrix; 'nuff said.
     ---
-    printStr = SPRanal.PrintPTP(PTP,ngrams,hideMIss=False)
+    printStr = SPRanal.PrintPTP(PTP,ngrams=None,hideMIss=False,n_p=None)
     ---
     PTP: specific PTP matrix that may have been built manually with BuildPTP
-    ngrams: list of all ngrams of a specified length, should match with PTP
+    ngrams*: (None) optional list of all ngrams of a specified length, should
+      match with PTP; if None, the ngrams are generated only for printed rows
     hideMiss*: (False) optional boolean flag; if true, rows in the PTP matrix
       for unobserved ngrams are not printed
+    n_p*: (None) optional integer length of the ngrams, for generating them; if
+      None, this comes from the number of rows, which is ambiguous if n_s = 1
     PTPstr: string that will print a nicely formatted PTP matrix
     ---
     JAH 20170619
     """
 
     # get the largest frequency, for formatting
-    mxFreq = max(PTP[self.n_s])
+    mxFreq = PTP.totals.max()
     fmts = ['%%%dd'%(int(math.log10(mxFreq))+1)]*(self.n_s+1)
     
-    # create the colunn heads and formatting strings
-    colHds = self.alpha.copy(); colHds.append('Tot')
-    if (len(PTP) > self.n_s+1):
-      # relFreq was on, so add alpha again
-      colHds.extend(self.alpha)
-      # and add the formats for freqs
-      fmts.extend(['%0.4f']*self.n_s)
+    # create the colunn heads and formatting strings, adding alpha again for
+    # the relative frequencies
+    colHds = self.alpha.copy(); colHds.append('Tot'); colHds.extend(self.alpha)
+    fmts.extend(['%0.4f']*self.n_s)
     
-    data = np.array(PTP).T
-    
-    # hide unobserved ngrams rows
+    # hide unobserved ngrams rows, by only taking the observed columns
     if hideMiss:
-      # get the missing rows ...
-      notMiss = [i for i,t in enumerate(PTP[self.n_s]) if t != 0]
-      # ... and remove them
-      data = data[notMiss,:]
-      rowHds = [ngrams[i] for i in notMiss]
+      notMiss = np.flatnonzero(PTP.totals)
+    else:
+      notMiss = np.arange(PTP.totals.size)
+    counts = PTP.counts[:,notMiss]; tots = PTP.totals[notMiss]
+    
+    # stack the arrays only for formatting, with a row for each ngram; the
+    # relative frequencies are only computed here, for the printed rows
+    rel = np.divide(counts,tots,out=np.zeros(counts.shape),where=(tots != 0))
+    data = np.concatenate((counts,tots[None,:],rel)).T
+    
+    # get the ngrams for the row heads
+    if ngrams is None:
+      # the number of rows is n_s**n_p, so get back n_p if not passed
+      if n_p is None:
+        n_p = 1
+        while (self.n_s**n_p < PTP.totals.size):
+          n_p += 1
+      rowHds = [self.NgramStr(n_p,i) for i in notMiss]
     else:
-      rowHds = ngrams
+      rowHds = [ngrams[i] for i in notMiss]
   
     return PrintTable(data,fmts,colHds,rowHds)  
 
@@ -210,47 +256,54 @@ class SPRanal:
     JAH 20170621
     """
     
-    # get the largest of the two n_s's and n_p's
+    # get the largest of the two n_s's
     Ns = max(self.n_s,otherSPR.n_s)
-    Np = max(self.n_p,otherSPR.n_p)
-    
-    # loop through all pairs of PTPs
-    # note the implicit assumption that if one of the sequencies has a larger n_s,
-    # that means that it has *extra* symbols *after* those of the other sequence
-    diff = 0
-    for n_p in range(Np):
-      # first: get my PTP, only the probabilities
-      try:
-        mine = np.array(self.PTPs[n_p][(self.n_s+1):],dtype=float)
-        # need to ensure it has enough rows & columns
-        if (self.n_s < Ns):
-          tmp = np.zeros((Ns,Ns**(n_p+1)),dtype=float)
-          # embed this PTP in a larger PTP with 0-padding
-          tmp[:mine.shape[0],:mine.shape[1]] = mine.copy(); mine = tmp
-      except IndexError:
-        # this one not found, so create a PTP of zeros
-        mine = np.zeros((Ns,Ns**(n_p+1)),dtype=float)
-      # second: get the other PTP, only the probabilities
-      try:
-        his = np.array(otherSPR.PTPs[n_p][(otherSPR.n_s+1):],dtype=float)
-        # need to ensure it has enough rows & columns
-        if (otherSPR.n_s < Ns):
-          tmp = np.zeros((Ns,Ns**(n_p+1)),dtype=float)
-          # embed this PTP in a larger PTP with 0-padding
-          tmp[:his.shape[0],:his.shape[1]] = his.copy(); his = tmp
-      except IndexError:
-        # this one not found, so create a PTP of zeros
-        his = np.zeros((Ns,Ns**(n_p+1)),dtype=float)    
-      # third: compute the sum of absolute differences
-      diff += np.sum(np.abs(his - mine))
-    
-    return diff
+    
+    # get both sets of PTPs, flattened into single vectors of probabilities
+    mine = self.__DistVec__(Ns)
+    his = otherSPR.__DistVec__(Ns)
+    
+    # if either sequence has a higher n_p, the PTPs of the other are all 0's
+    if (mine.size < his.size):
+      mine = np.pad(mine,(0,his.size-mine.size))
+    elif (his.size < mine.size):
+      his = np.pad(his,(0,mine.size-his.size))
+    
+    # compute the sum of absolute differences in one pass
+    return float(np.abs(his - mine).sum(dtype=float))
+
+  def __DistVec__(self,Ns):
+    """
+    Concatenate the probabilities from all the PTPs into a single vector for
+    computing distances, with each PTP embedded in an (Ns,Ns**(n_p+1)) matrix.
+    The vector is cached for each Ns, since it only changes with the PTPs.
+    ---
+    vec = SPRanal.__DistVec__(Ns)
+    ---
+    Ns: integer size of the alphabet to pad up to, must be >= n_s
+    vec: 1d float32 array of the padded probabilities for all PTPs
+    """
+    
+    try:
+      return self.distVecs[Ns]
+    except KeyError:
+      pass
+    
+    # loop through all PTPs
+    # note the implicit assumption that if the other sequence has a larger n_s,
+    # that means that it has *extra* symbols *after* those of this sequence
+    # so embed each PTP in a larger PTP with 0-padding
+    vecs = [np.pad(P.probs,((0,Ns-self.n_s),(0,Ns**(n_p+1)-self.n_s**(n_p+1)))).ravel()\
+      for n_p,P in enumerate(self.PTPs)]
+    
+    self.distVecs[Ns] = np.concatenate(vecs) if vecs else np.zeros(0,dtype=np.float32)
+    return self.distVecs[Ns]
 
   def Simulate(self,nstar):
     """
     Use the conditional probabilities in the PTP matrices to simulate sequences
     with similar pattern transition behavior as in the original sequence. This 
-    uses the Predict function to compute the probabilities.
+    uses the same weighted probabilities as the Predict function.
     ---
     simulation = SPRanal.Simulate(nstar)
     ---
@@ -260,33 +313,23 @@ class SPRanal:
     JAH 20170621
     """
     
+    if (self.n_p == 0):
+      raise ValueError('no PTPs passed the sparsity threshold, so cannot simulate')
+    
+    # the sequence end must be in the alphabet to start from a PTP row
+    start = self.code[-self.n_p:]
+    if not (start >= 0).all():
+      raise ValueError('the sequence end has symbols not in the alphabet')
+    
     # generate up front all the random variates needed
     rnds = np.random.rand(nstar)
-    simRng = range(self.n_s)
-    # setup the one-symbol simulator lambda function  
-    simOne = lambda rnd,prbs: [self.alpha[i] for i,p in zip(simRng,(rnd <= prbs)) if p][0]
-    
-    # predict the next symbol to start off the simulation
-    alphaProbs = self.Predict()[1]
-    Sstar = simOne(rnds[0],np.cumsum(alphaProbs))
-    
-    # to be more efficient, we'll save every list of alphaProbs we see, keyed
-    # to the subsequence which generated it
-    subSeqs = dict()
-    
-    # now loop through and generate each new simulated symbol, each time using
-    # a PTP of bigger i, up to a max of n_p
-    for i in range(1,nstar):
-      subSeq = Sstar[-min(i,self.n_p):]
-      try:
-        alphaProbs = subSeqs[subSeq]
-      except KeyError:
-        # didn't see this subsequence before, so generate then save it
-        alphaProbs = self.Predict(subSeq)[1]
-        subSeqs[subSeq] = alphaProbs
-      Sstar += simOne(rnds[i],np.cumsum(alphaProbs))
+    
+    # simulate the coded symbols, each time using a PTP of bigger i, up to a max
+    # of n_p; the probabilities are saved alongside those from Predict
+    simCodes = SimulateCore(start,rnds,self.rowOffs,self.countTable,\
+      self.totTable,self.predCache,self.n_s)
   
-    return Sstar
+    return ''.join([self.alpha[c] for c in simCodes])
 
   def Predict(self,predStart = None):
     """
@@ -300,35 +343,39 @@ class SPRanal:
       to predict the next symbol; otherwise, the last n_p symbols of the 
       sequence is used
     prediction: the predicted next symbol
-    probabilities: list of probabilities for each symbol in the alphabet, conditional
+    probabilities: array of probabilities for each symbol in the alphabet, conditional
       upon the sequence
     ---
     JAH 20170621
     """
     
-    # generate the ending point 
+    if (self.n_p == 0):
+      raise ValueError('no PTPs passed the sparsity threshold, so cannot predict')
+    
+    # generate the ending point; code the symbols, then the PTP rows come from
+    # arithmetic on the codes
     if predStart is None:
-      predStart = self.sequence[-self.n_p:]
-      w = self.n_p
+      codes = self.code[-self.n_p:]
     else:
-      w = min(len(predStart),self.n_p)
-    
-    # loop through the PTP matrices to get the conditional probabilities
-    alphaProbs = []
-    for i in range(w):
-      # get the last i symbols from the sequence ...
-      seqEnd = predStart[-(i+1):]
-      # then find in the appropriate ngram ...
-      nxtRow = self.ngrams[i].index(seqEnd)
-      # then get the appropriate row from the appropriate PTP
-      alphaProbs.append([p[nxtRow] for p in self.PTPs[i][self.n_s+1:]])
-      # if this row is entirely blank, subtract 1 for this PTP from w
-      w -= (self.PTPs[i][self.n_s][nxtRow] == 0)
-    # now that all the probs have been gathered, compute the weighted average
-    alphaProbs = [sum(i)/w for i in zip(*alphaProbs)]
+      codes = self.__Code__(predStart[-self.n_p:])
+    # codes of -1 would silently give the row of a different ngram
+    if not (codes >= 0).all():
+      raise ValueError('the sequence end has symbols not in the alphabet')
+    
+    # the probabilities depend only on the row of the whole ending point in the
+    # largest PTP used, so check if they are saved from an earlier prediction
+    w = codes.size
+    if w == 0:
+      alphaProbs = PredictProbs(codes,self.rowOffs,self.countTable,self.totTable,self.n_s)
+    else:
+      key = self.rowOffs[w-1] + codes @ (self.n_s**np.arange(w-1,-1,-1,dtype=np.int64))
+      if np.isnan(self.predCache[key,0]):
+        # get the conditional probabilities from all PTPs and the weighted average
+        self.predCache[key] = PredictProbs(codes,self.rowOffs,self.countTable,self.totTable,self.n_s)
+      alphaProbs = self.predCache[key].copy()
     
     # finally, return the prediction and also all the probabilities
-    return self.alpha[alphaProbs.index(max(alphaProbs))],alphaProbs
+    return self.alpha[np.argmax(alphaProbs)],alphaProbs
 
   def BuildPTPs(self,talk=False):
     """
@@ -347,9 +394,6 @@ class SPRanal:
     JAH 20170620
     """
     
-    # make list of lists of ngrams
-    ngramS = self.MakenGrams()
-    
     # sparsTities table: [Observed,Expected,Sparsity]; yes the typo is intended :-)
     sparsTities = [[0]*self.maxn_p]
     sparsTities.append([self.n_s**i for i in range(1,self.maxn_p+1)])
@@ -358,8 +402,13 @@ class SPRanal:
     ''' Note this all works because the found patterns from computing PTP_i
     is *almost* the observed for PTP_{i+1} '''
     
-    # the list of observeds for n_p=1 is just the list of unique values
-    fnd_ip1 = np.unique(list(self.sequence)).tolist()
+    # all PTPs come from the histograms of codes of windows of increasing length
+    windows = self.__WindowHists__()
+    
+    # the list of observeds for n_p=1 is just the list of unique values; as
+    # for all found patterns, these are coded as integers, so stripping off the
+    # last element of a pattern is just integer division by n_s
+    fnd_ip1 = np.flatnonzero(next(windows))
    
     # loop through PTPs up to maxn_p until SI < t_np
     PTPs = []
@@ -367,13 +416,17 @@ class SPRanal:
       # compute the sparsity for PTP_{i}, using found patterns from PTP_{i-1}
       # to get the observed, strip off the last elements of the found patterns
       # and unique the list (How do you catch a unique cat? Unique up on him!)
-      sparsTities[0][i] = np.unique([i[:-1] for i in fnd_ip1]).size
+      sparsTities[0][i] = np.unique(fnd_ip1//self.n_s).size
       sparsTities[2][i] = sparsTities[0][i]/sparsTities[1][i]
       # can we exit early?
       if (sparsTities[2][i] < self.t_np):
         break
-      # build the PTP_i matrix
-      (PTP_i,fnd_ip1) = self.BuildPTP(ngramS[i],ngramsRed=fnd_ip1)
+      # build the PTP_i matrix from the windows of length i+2, unless the
+      # sequence is too short to have any (then so it is for all higher PTPs)
+      if (self.n <= i+1):
+        (PTP_i,fnd_ip1) = self.__EmptyPTP__(i+1)
+      else:
+        (PTP_i,fnd_ip1) = self.__PTPFromHist__(next(windows),i+1)
       PTPs.append(PTP_i)
     # final increment i to maxn_p iff all PTPs passed
     i += (sparsTities[2][i] >= self.t_np)
@@ -383,15 +436,16 @@ class SPRanal:
         print(PrintTable(np.array(sparsTities).T[:i,:],['%d','%d','%0.4f'],\
         ['Obs','Poss','SI'],[str(i) for i in range(1,i+1)]))
     
-    # set the list of PTPs, the ngrams, and the truncated sparsities table
-    self.__SetPTP__(i,PTPs,ngramS[:i],[col[:i] for col in sparsTities])
+    # set the list of PTPs and the truncated sparsities table
+    self.__SetPTP__(i,PTPs,[col[:i] for col in sparsTities])
 
   def MakenGrams(self,maxn_p=None,only=False):
     """
     For a specified alphabet, return lists of ngrams up to a max length of maxn_p.
-    Optionally, return a list of ngrams of only the specified n_p.  This works by
-    using a set of reccurrence relations for a) the pattern between the columns
-    in each set of ngrams, and b) between each set of ngrams.
+    Optionally, return a list of ngrams of only the specified n_p.  The ngrams
+    are in alphabet order, so each is generated from its row index in the PTP
+    matrix with NgramStr.  BuildPTPs does not need these; they are only useful
+    for printing.
     ---
     usage: ngrams = SPRanal.MakenGrams(maxn_p=None,only=False)
     ---
@@ -408,121 +462,155 @@ class SPRanal:
     
     # if the only flag is True, just do the specified n_p
     if only:
-      ngrams = []
-      for cnt in range(maxn_p):
-        # number times to repeat each letter *in the subsequence*
-        letrepts = self.n_s**cnt
-        # number times to repeat the subsequences
-        arrrepts = self.n_s**(maxn_p - 1 - cnt)    
-        # build the subsequence and sort
-        tmp = self.alpha*letrepts; tmp.sort() # this uses Timsort, which is state of the art
-        # repeat the subsequences & append
-        ngrams.append((tmp)*arrrepts) 
-      # join across lists in this set of ngrams, and also
-      # reverse the columns order so the patterns are lexicographically sorted
-      ngrams = [''.join(i) for i in zip(*ngrams[::-1])]
+      return [self.NgramStr(maxn_p,row) for row in range(self.n_s**maxn_p)]
     else:
-      ngrams = []
-      thisngrams = []
-      # build the largest ngram first
-      for cnt in range(maxn_p):
-        # number times to repeat each letter *in the subsequence*
-        letrepts = self.n_s**cnt
-        # number times to repeat the subsequences
-        arrrepts = self.n_s**(maxn_p - 1 - cnt)    
-        # build the subsequence and sort
-        tmp = self.alpha*letrepts; tmp.sort() # this uses Timsort, which is state of the art
-        # repeat the subsequences & append
-        thisngrams.append((tmp)*arrrepts) 
-      # join across lists in this set of ngrams, and also
-      # reverse the columns order so the patterns are lexicographically sorted
-      ngrams.append([''.join(i) for i in zip(*thisngrams[::-1])])
-      # now sequentially tear down the largest set of ngrams to build the others
-      # this uses the recurrence relation (ng_i = ng_i+1}[:alpha*i,:-1])
-      for cnt in range(maxn_p-1,1,-1):
-        # remove the last column, then in each column just keep the first elements
-        thisngrams = [col[:(self.n_s**cnt)] for col in thisngrams[:-1]]
-        # join columns, reverse, and save in ngrams
-        ngrams.append([''.join(i) for i in zip(*thisngrams[::-1])])
-      # now add directly the 1st ngram
-      ngrams.append(self.alpha)
+      return [[self.NgramStr(n_p,row) for row in range(self.n_s**n_p)]\
+        for n_p in range(1,maxn_p+1)]
+
+  def NgramStr(self,n_p,row):
+    """
+    Generate the ngram for a row of a PTP matrix; since the rows are in alphabet
+    order, the row index is the mixed-radix number of the symbols' codes.
+    ---
+    usage: ngram = SPRanal.NgramStr(n_p,row)
+    ---
+    n_p: integer length of the ngram
+    row: integer row index of the ngram in PTP_{n_p-1}
+    ngram: string ngram
+    """
     
-    if only:
-      return ngrams
-    else:
-      return ngrams[::-1]
+    return ''.join(self.alpha[(row//self.n_s**(n_p-1-k))%self.n_s] for k in range(n_p))
 
-  def BuildPTP(self,ngrams,ngramsRed=None):    
+  def BuildPTP(self,n_p,ngramsRed=None):    
     """
-    Use an optimized Rabin-Karp hash search algorithm to build the complete pattern
-    transition matrix for a specific length i=n_p. The symbols in the search string
-    should be limited to the alphabet used to generate the ngrams. This algorithm
-    can take advantage of the recurrence relation that PTP_{i+1} can not have any
-    rows which are built from following patterns not found for PTP_i. To do so, 
-    pass as ngramsRed the fndPatterns output from PTP_i.
-    ---
-    usage: (PTP,fndPatterns) = SPRanal.BuildPTP(ngrams,ngramsRed=None)
-    ---
-    ngrams: list of n_p-grams from which to build the PTP matrix
-    ngramsred: reduced list of n_p-grams that are supposedly known to exist in
-      the sequence
-    PTP: the complete nested list of pattern transition frequencies, with a row
-      for each ngram, a column for the following frequency for each symbol in
-      the alphabet, followed by a total column, followed by columns of relative
-      frequencies
-    fndPatterns: list of actual found patterns, which can be passed in to this
-      function to more quickly build the PTP matrix for the next higher n_p
+    Build the complete pattern transition matrix for a specific length i=n_p. The
+    symbols in the sequence should be limited to the alphabet. Rather than
+    searching for each ngram separately, this codes every (n_p+1)-length window
+    in the sequence as an integer and takes a histogram of the codes; each window
+    is an ngram followed by the next symbol, so the histogram is the PTP matrix.
+    ---
+    usage: (PTP,fndPatterns) = SPRanal.BuildPTP(n_p,ngramsRed=None)
+    ---
+    n_p: integer length of the ngrams; for backwards compatibility, this can
+      also be the list of all n_p-grams from MakenGrams
+    ngramsRed*: (None) optional array of the integer rows of n_p-grams that are
+      supposedly known to exist in the sequence, such as the fndPatterns from
+      BuildPTP(n_p-1); frequencies for all other ngrams are set to 0.  For
+      backwards compatibility, this can also be a list of n_p-grams
+    PTP: the complete pattern transition matrix as a PTPData, holding the
+      following frequency for each symbol in the alphabet and the totals, with
+      a column for each ngram
+    fndPatterns: sorted array of actual found patterns, each coded as the integer
+      row of its ngram * n_s + the code of the following symbol, which can be
+      used to quickly compute the sparsity for the next higher n_p, or passed
+      as its ngramsRed
     ---
     JAH 20170619
     """
     
-    # pre-build the first half of the PTP matrix
-    PTP = [[0]*len(ngrams) for _ in self.alpha]
-  
     # more lengths
-    n_p = len(ngrams[0])
+    if isinstance(n_p,(list,tuple)):
+      n_p = len(n_p[0])
+    
+    # if the sequence is too short, there are no patterns to count
+    if (self.n <= n_p):
+      return self.__EmptyPTP__(n_p)
+    
+    # get the histogram of codes of windows of length n_p+1
+    hist = next(self.__WindowHists__(n_p+1))
+    
+    # restrict to the reduced list of ngrams, coding them first if needed
+    if ngramsRed is not None:
+      if (len(ngramsRed) != 0) and isinstance(ngramsRed[0],str):
+        pows = self.n_s**np.arange(n_p-1,-1,-1,dtype=np.int64)
+        codes = [self.__Code__(g) for g in ngramsRed]
+        if any((c.size != n_p) or (c < 0).any() for c in codes):
+          raise ValueError('ngramsRed has ngrams of the wrong length or not in the alphabet')
+        ngramsRed = [c.astype(np.int64) @ pows for c in codes]
+      ngramsRed = np.asarray(ngramsRed,dtype=np.int64)
+      # negative rows would wrap around to unrelated ngrams
+      if ((ngramsRed < 0) | (ngramsRed >= self.n_s**n_p)).any():
+        raise ValueError('ngramsRed has rows outside of PTP_%d'%(n_p-1))
+      keep = np.zeros(self.n_s**n_p,dtype=bool)
+      keep[ngramsRed] = True
+      hist = (hist.reshape(self.n_s**n_p,self.n_s)*keep[:,None]).ravel()
+    
+    return self.__PTPFromHist__(hist,n_p)
+
+  def __WindowHists__(self,L=1):
+    """
+    Generate the histograms of the integer codes of all windows in the sequence
+    of each length L,L+1,..., skipping windows with symbols not in the alphabet.
+    A window is coded as the mixed-radix number of its symbols' codes, which is
+    the row of its ngram * n_s + the following code.  With numba, each histogram
+    comes from one compiled pass over the sequence, rolling the code forward.
+    Otherwise, the codes for each length come from those for the previous length
+    with a single in-place multiply-add per position, so all lengths share one
+    walk of the sequence.
+    ---
+    for hist in SPRanal.__WindowHists__(L=1): ...
+    ---
+    L*: (1) optional integer length of the first windows
+    hist: int64 array of length n_s**L of the frequency of each window code
+    """
     
-    # set the list of search items as appropriate
-    # must also build a list of indices of the reduced list into the ngrams list
-    if (ngramsRed == None):
-      searchMe = ngrams
-      ngramsInd = range(len(ngrams))
+    if haveNumba:
+      while True:
+        yield WindowHist(self.code,L,self.n_s)
+        L += 1
     else:
-      searchMe = ngramsRed
-      ngramsInd = [ngrams.index(i) for i in ngramsRed]
-    
-    # loop through each ngram and do the searching
-    fndPatts = []
-    for i,ngram in zip(ngramsInd,searchMe):
-      # get all the starting indices    
-      indxs = HashSearch(self.sequence,ngram,self.hashP['p'],self.hashP['x'])
-      # get all the following chars
-      chars = [self.sequence[i+n_p] for i in indxs if i+n_p+1 <= self.n]
-      # compute the frequencies
-      freqs = np.unique(chars,return_counts=True)
-      # now must loop through the alphabet to get the full tabulation :-(
-      if (len(freqs[0]) != 0):
-        for j,alph in enumerate(self.alpha):
-          try:
-            PTP[j][i] = freqs[1][freqs[0]==alph][0]
-          except IndexError:
-            # if this symbol is not in the tabulation, do nothing
-            pass
-        # store the actual found patterns, which can be used for the next higher PTP
-        for alph in freqs[0]:
-          fndPatts.append(ngram+alph)
-  
-    # now create the totals
-    tots = [sum(i) for i in zip(*PTP)]
-    PTP.append(tots)
-    # finally, generate the relative frequencies
-    rel = []
-    for col in PTP[:-1]:
-      rel.append([i/t if t != 0 else 0.0 for i,t in zip(col,tots)])
-    PTP.extend(rel)
+      wcode = np.zeros(self.n,dtype=np.int64)
+      good = np.ones(self.n,dtype=bool)
+      thisL = 1
+      while True:
+        nWin = max(self.n-thisL+1,0)
+        # append the next symbol to every window still in the sequence
+        wcode = wcode[:nWin]; wcode *= self.n_s; wcode += self.code[thisL-1:]
+        good = good[:nWin]; good &= (self.code[thisL-1:] >= 0)
+        if (thisL >= L):
+          yield np.bincount(wcode[good],minlength=self.n_s**thisL)
+        thisL += 1
+
+  def __EmptyPTP__(self,n_p):
+    """
+    Build an empty pattern transition matrix for a specific length i=n_p, for a
+    sequence with no patterns of length n_p+1; see BuildPTP.
+    ---
+    (PTP,fndPatterns) = SPRanal.__EmptyPTP__(n_p)
+    ---
+    n_p: integer length of the ngrams
+    PTP: the pattern transition matrix of all 0's as a PTPData
+    fndPatterns: empty array of found patterns
+    """
+    
+    return PTPData(np.zeros((self.n_s,self.n_s**n_p),dtype=np.int32),\
+      np.zeros(self.n_s**n_p,dtype=np.int32)), np.zeros(0,dtype=np.int64)
+
+  def __PTPFromHist__(self,hist,n_p):
+    """
+    Build the complete pattern transition matrix for a specific length i=n_p from
+    the histogram of codes of all windows of length n_p+1; see BuildPTP.
+    ---
+    (PTP,fndPatterns) = SPRanal.__PTPFromHist__(hist,n_p)
+    ---
+    hist: int64 array of the frequency of each window code of length n_p+1
+    n_p: integer length of the ngrams
+    PTP: the complete pattern transition matrix as a PTPData
+    fndPatterns: sorted array of actual found patterns
+    """
+    
+    # the histogram of window codes has the frequencies in (row,following code)
+    # order, so it is the PTP matrix transposed
+    freqs = np.ascontiguousarray(hist.reshape(self.n_s**n_p,self.n_s).T,dtype=np.int32)
+    
+    # store the actual found patterns, which can be used for the next higher PTP
+    fndPatts = np.flatnonzero(hist)
+    
+    # then create the totals
+    tots = freqs.sum(0,dtype=np.int32)
   
     # return the final full PTP matrix
-    return PTP, fndPatts
+    return PTPData(freqs,tots), fndPatts
 
 if (__name__ == "__main__"):
   '''
@@ -533,12 +621,12 @@ if (__name__ == "__main__"):
   print(thisSPR)
   # set it up for the modeling - this must be done before anything else
   # from Section 3.1 Learning Pattern Transition Behaviour of the original article
-  thisSPR.SetPTPParams(10,0.1,{'p':4241,'x':42})
+  thisSPR.SetPTPParams(10,0.1)
   print(thisSPR)
   
-  # functions (used by BuildPTPs) to generate specified ngrams and PTP matrices
+  # functions (used by BuildPTPs) to generate specified PTP matrices and ngrams
+  PTP_2 = thisSPR.BuildPTP(2)[0]
   ngrams_2 = thisSPR.MakenGrams(maxn_p=2,only=True)
-  PTP_2 = thisSPR.BuildPTP(ngrams_2,ngramsRed=None)[0]
   print(thisSPR.PrintPTP(PTP_2,ngrams_2,True))
   
   # identify the optimal n_p and set the PTP matrices 
@@ -553,11 +641,11 @@ if (__name__ == "__main__"):
   # compute the distances between some sequences; these are from section
   # 3.4 Clustering with SPR
   SstarSPR = SPRanal(thisSPR.alpha,'abcbaabcabccbabcabcb')
-  SstarSPR.SetPTPParams(10,0.1,{'p':4241,'x':42})
+  SstarSPR.SetPTPParams(10,0.1)
   SstarSPR.BuildPTPs(True)
   
   SstarstarSPR = SPRanal(thisSPR.alpha,'bcbabcbaababcbababcc')
-  SstarstarSPR.SetPTPParams(10,0.1,{'p':4241,'x':42})
+  SstarstarSPR.SetPTPParams(10,0.1)
   SstarstarSPR.BuildPTPs(True)
   print('dist(S,S*) = %0.2f'%thisSPR.Distance(SstarSPR))
   print('dist(S,S**) = %0.2f'%thisSPR.Distance(SstarstarSPR))
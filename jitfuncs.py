@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SPR compiled functions for the inner loops, which work on integer-coded symbols
+and stacked PTP frequency arrays.  These are compiled with numba if it is available; if
+not, they run as plain python.  The functions have explicit signatures, so they
+are compiled when this module is imported, and the compiled code is cached on
+disk; run precompile.py once to fill the cache.
+
+Symbols are coded by their index in the alphabet, so the row for an ngram in a
+PTP is just the mixed-radix number of its codes, with the first symbol most
+significant.  The rows of all PTPs are stacked into one table, in which the
+rows for PTP_i start at offsets[i].
+
+
+Copyright (C) 2017 J. Andrew Howe
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+try:
+  from numba import njit
+  haveNumba = True
+except ImportError:
+  haveNumba = False
+  # no numba, so the decorator does nothing
+  def njit(*args,**kwargs):
+    if (len(args) == 1) and callable(args[0]):
+      return args[0]
+    return lambda func: func
+
+
+@njit('float64[:](int16[:],int64[:],int32[:,:],int32[:],int64)',cache=True)
+def PredictProbs(codes,offsets,counts,totals,n_s):
+  """
+  Compute the probabilities of the next symbol following a coded sequence end,
+  weighting the probabilities from all PTPs evenly.  PTPs in which the sequence
+  end is not observed are ignored; if it is observed in none, this raises a
+  ZeroDivisionError.
+  ---
+  Usage: alphaProbs = PredictProbs(codes,offsets,counts,totals,n_s)
+  ---
+  codes: int16 array of coded symbols at the end of the sequence
+  offsets: int64 array of the starting row of each PTP in the stacked tables
+  counts: (rows,n_s) int32 array of stacked frequencies
+  totals: (rows,) int32 array of stacked total frequencies
+  n_s: integer cardinality of the alphabet
+  alphaProbs: float array of probabilities for each symbol in the alphabet
+  """
+
+  w = min(codes.size,offsets.size)
+  # the probabilities from each PTP, and whether the ngram was seen in it
+  P = np.zeros((w,n_s))
+  valid = np.zeros(w,dtype=np.bool_)
+  row = 0; mult = 1
+  for i in range(w):
+    # add the next symbol back from the end to the row of this ngram
+    row += int(codes[codes.size-1-i])*mult; mult *= n_s
+    # rows for unseen ngrams are all 0, so dividing by 1 instead leaves them 0
+    tot = totals[offsets[i]+row]
+    P[i] = counts[offsets[i]+row]/max(tot,1)
+    valid[i] = (tot != 0)
+
+  # average over only the PTPs in which the ngram was seen
+  nValid = valid.sum()
+  if (nValid == 0):
+    raise ZeroDivisionError('the sequence end was not observed in any PTP')
+  return P.sum(axis=0)/nValid
+
+
+# no fastmath here, since it would assume the NaNs in the cache away
+@njit('int16[:](int16[:],float64[:],int64[:],int32[:,:],int32[:],float64[:,:],int64)',cache=True)
+def SimulateCore(start,rnds,offsets,counts,totals,cache,n_s):
+  """
+  Simulate a coded sequence of symbols with similar pattern transition behavior
+  as in the original sequence.  The first symbol follows the coded end of the
+  original sequence; the rest follow only the simulated symbols.  Probabilities
+  are saved in cache, keyed by stacked row, and reused.
+  ---
+  Usage: simCodes = SimulateCore(start,rnds,offsets,counts,totals,cache,n_s)
+  ---
+  start: int16 array of coded symbols at the end of the original sequence
+  rnds: float array of uniform random variates, one per simulated symbol
+  offsets: int64 array of the starting row of each PTP in the stacked tables
+  counts: (rows,n_s) int32 array of stacked frequencies
+  totals: (rows,) int32 array of stacked total frequencies
+  cache: (rows,n_s) float array of saved probabilities, NaN if not yet computed
+  n_s: integer cardinality of the alphabet
+  simCodes: int16 array of coded simulated symbols
+  """
+
+  nstar = rnds.size
+  n_p = offsets.size
+  # nopython code does not check bounds, so an empty table must be caught here
+  assert n_p > 0
+  mxRow = n_s**n_p
+  simCodes = np.empty(nstar,dtype=np.int16)
+
+  # get the row of the ending point in the largest PTP
+  w = start.size; row = 0
+  for k in range(w):
+    row = row*n_s + int(start[k])
+
+  for t in range(nstar):
+    key = offsets[w-1] + row
+    if np.isnan(cache[key,0]):
+      # didn't see this subsequence before, so generate and save it
+      if (t == 0):
+        cache[key] = PredictProbs(start,offsets,counts,totals,n_s)
+      else:
+        cache[key] = PredictProbs(simCodes[t-w:t],offsets,counts,totals,n_s)
+    # the next symbol is the first with cumulative probability >= the variate
+    code = np.searchsorted(np.cumsum(cache[key]),rnds[t])
+    simCodes[t] = min(code,n_s-1)
+    # after the first symbol, only the simulated symbols are used
+    if (t == 0):
+      w = 0; row = 0
+    row = (row*n_s + int(simCodes[t])) % mxRow
+    w = min(w+1,n_p)
+
+  return simCodes
+
+
+@njit('int64[:](int16[:],int64,int64)',cache=True)
+def WindowHist(code,L,n_s):
+  """
+  Compute the histogram of the integer codes of all windows of length L in a
+  coded sequence, skipping windows with symbols not in the alphabet.  A window
+  is coded as the mixed-radix number of its symbols' codes, which is rolled
+  forward one symbol at a time, so this is a single pass for any L.
+  ---
+  Usage: hist = WindowHist(code,L,n_s)
+  ---
+  code: int16 array of the coded sequence, -1 for symbols not in the alphabet
+  L: integer length of the windows
+  n_s: integer cardinality of the alphabet
+  hist: int64 array of length n_s**L of the frequency of each window code
+  """
+
+  hist = np.zeros(n_s**L,dtype=np.int64)
+  # dividing by this drops the oldest symbol from a window
+  mod = n_s**(L-1)
+  wcode = 0; run = 0
+  for k in range(code.size):
+    c = int(code[k])
+    if (c < 0):
+      # start the windows over after a symbol not in the alphabet
+      wcode = 0; run = 0
+      continue
+    wcode = (wcode % mod)*n_s + c
+    run += 1
+    if (run >= L):
+      hist[wcode] += 1
+
+  return hist
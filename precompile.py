@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compile the numba functions used by SPR and save them in the on-disk cache, so
+the first SPR analysis in a new session does not wait for compilation.  Run
+this once after installing or updating; without numba, there is nothing to do.
+
+
+Copyright (C) 2017 J. Andrew Howe
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+# importing compiles all the signatures and caches them
+from jitfuncs import *
+
+if (__name__ == "__main__"):
+  if not haveNumba:
+    print('numba not found; SPR will run the inner loops as plain python')
+  else:
+    # run each function on a tiny 2-symbol, 1-PTP problem to be sure it works
+    offsets = np.zeros(1,dtype=np.int64)
+    counts = np.ones((2,2),dtype=np.int32)
+    totals = np.full(2,2,dtype=np.int32)
+    cache = np.full((2,2),np.nan)
+    start = np.zeros(1,dtype=np.int16)
+    PredictProbs(start,offsets,counts,totals,2)
+    SimulateCore(start,np.random.rand(5),offsets,counts,totals,cache,2)
+    WindowHist(np.array([0,1,-1,1,0],dtype=np.int16),2,2)
+    print('numba functions compiled and cached')